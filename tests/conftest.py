@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Shared pytest fixtures.
+"""
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def aws_region():
+    """
+    Region used by the boto3 clients in the tests.
+
+    The region is always overridden, `./manage tests` sets it to a placeholder that
+    moto doesn't know about.
+    """
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    return "us-east-1"
@@ -2,6 +2,7 @@
 """
 Fixtures used in tests
 """
+import json
 
 COMPLEX_RESOURCE = {
     "Type": "AWS::S3::Bucket",
@@ -44,6 +45,8 @@ SIMPLE_JSON = {
     },
 }
 
+SIMPLE_JSON_TEXT = json.dumps(SIMPLE_JSON)
+
 SIMPLE_YAML = """
 AWSTemplateFormatVersion: '2010-09-09'
 Resources:
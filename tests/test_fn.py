@@ -2,6 +2,9 @@
 """
 Testing models that maps to Cloudformation functions.
 """
+import copy
+import pickle
+
 import pytest
 
 from vapor.fn import replace_fn, Ref, Fn
@@ -43,6 +46,45 @@ def test_replace_fn():
         replace_fn({"class": set([])})
 
 
+def test_replace_fn_tuple():
+    """Tuples are replaced as lists, like json does."""
+    assert replace_fn({"Values": ("a", Ref("B"))}) == {"Values": ["a", {"Ref": "B"}]}
+
+
+def test_replace_fn_deep_node():
+    """replace_fn should not be limited by the recursion limit."""
+    node = leaf = []
+    for _ in range(5000):
+        leaf.append([])
+        leaf = leaf[0]
+    leaf.append(Ref("Deep"))
+
+    replaced = replace_fn(node)
+    for _ in range(5001):
+        replaced = replaced[0]
+    assert replaced == {"Ref": "Deep"}
+
+
+def test_render_fresh():
+    """Each render returns a new dictionary, following changes to the arguments."""
+    node = Fn.Join("-", ["a", Ref("B")])
+    node.render()["Fn::Join"][0] = "+"
+    assert node.render() == {"Fn::Join": ["-", ["a", {"Ref": "B"}]]}
+
+    node.elements.append("c")
+    assert node.render() == {"Fn::Join": ["-", ["a", {"Ref": "B"}, "c"]]}
+
+
+def test_ref_copy():
+    """Refs and the functions using them can be copied and pickled."""
+    template = {"Key": Fn.Join("-", [Ref("AWS::Region"), "suffix"])}
+    expected = {"Key": {"Fn::Join": ["-", [{"Ref": "AWS::Region"}, "suffix"]]}}
+    assert replace_fn(copy.copy(template)) == expected
+    assert replace_fn(copy.deepcopy(template)) == expected
+    assert replace_fn(pickle.loads(pickle.dumps(template))) == expected
+    assert copy.copy(Ref("Name")).target == "Name"
+
+
 def test_base64():
     """Test Fn.Base64 function."""
     assert Fn.Base64("AWS CloudFormation").render() == {
@@ -240,3 +282,19 @@ def test_transform():
         Fn.Transform(
             {"name": "AWS::Include", "Parameters": {"Location": Ref("InputValue")}}
         )
+
+
+def test_replace_fn_subclass():
+    """Subclasses of Fn nodes are rendered, classes only sharing a name are not."""
+
+    class Join(Fn.Join):  # pylint: disable=R0903
+        """A subclass of Fn.Join."""
+
+    class Sub:  # pylint: disable=R0903
+        """Not a cloudformation function."""
+
+    assert replace_fn({"Key": Join("-", ["a", "b"])}) == {
+        "Key": {"Fn::Join": ["-", ["a", "b"]]}
+    }
+    with pytest.raises(ValueError):
+        replace_fn({"Key": Sub()})
@@ -3,7 +3,6 @@
 Testing hooks.
 """
 import json
-import os
 from copy import deepcopy
 from types import SimpleNamespace
 
@@ -14,13 +13,11 @@ from moto.cloudformation import cloudformation_backend
 # vapor generates modules on demand.
 # pylint: disable=E0611
 from vapor import S3, Stack
-from vapor.hooks import check_template_with_cfn_lint
+from vapor.hooks import check_template_with_cfn_lint, get_cfnlint_rules
+from vapor.utils import map_parallel
 from tests.fixtures import SIMPLE_JSON
 
 
-os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
-
-
 class Bucket(S3.Bucket):
     """test S3 resource"""
 
@@ -57,14 +54,25 @@ def test_cfn_lint():
         assert wrapper_exit.value.code == 2
 
 
+def test_cfnlint_rules_per_thread():
+    """cfn-lint rules are reused in a thread, but not shared with other threads."""
+    rules = get_cfnlint_rules("us-east-1")
+    assert get_cfnlint_rules("us-east-1") is rules
+    assert map_parallel(get_cfnlint_rules, ["us-east-1"])[0] is not rules
+
+
 @mock_cloudformation
 def test_rollback_cleaner():
     """Test the rollback cleanup hook."""
     stack = S3Stack()
 
-    # using an internal method to create the stack while not creating resources.
-    # pylint: disable=E1101,W0212
-    stack._Stack__create_changeset()
+    # A changeset creates the stack without creating resources.
+    stack.client.create_change_set(
+        StackName=stack.name,
+        TemplateBody=stack.json,
+        ChangeSetName="changeset",
+        ChangeSetType="CREATE",
+    )
     backend_stack = list(cloudformation_backend.stacks.values())[0]
     backend_stack.status = "ROLLBACK_COMPLETE"
     stack.pre_deploy(dryrun=False, wait=True)
@@ -3,15 +3,18 @@
 Testing vapor-import mechanism.
 """
 import ast
-import json
-import pathlib
-import sys
-import tempfile
+from types import SimpleNamespace
 
 import pytest
 
-from vapor.__main__ import CfnTemplate, Resource, import_
-from tests.fixtures import COMPLEX_RESOURCE, SIMPLE_JSON, SIMPLE_OUTPUT, SIMPLE_YAML
+from vapor.__main__ import CfnTemplate, Resource, import_, parse_node
+from tests.fixtures import (
+    COMPLEX_RESOURCE,
+    SIMPLE_JSON,
+    SIMPLE_JSON_TEXT,
+    SIMPLE_OUTPUT,
+    SIMPLE_YAML,
+)
 
 
 def _lines(content):
@@ -218,10 +221,26 @@ def test_cfn_functions():
     assert_ref(getazs_call.args[0], "AWS::Region")
 
 
+def test_parse_deep_node():
+    """parse_node should not be limited by the recursion limit."""
+    node = leaf = []
+    for _ in range(5000):
+        leaf.append([])
+        leaf = leaf[0]
+    leaf.append({"Ref": "Deep"})
+
+    parsed = parse_node(node)
+    for _ in range(5001):
+        assert isinstance(parsed, ast.List)
+        parsed = parsed.elts[0]
+    assert_ref(parsed, "Deep")
+
+
 def test_template_object():
     """test the template object"""
     cfn = CfnTemplate(SIMPLE_JSON)
     assert len(cfn.resources) == 1 and cfn.resources[0].logical_name == "Bucket"
+    assert cfn.resources[0].astobj is cfn.resources[0].astobj
     assert cfn.services == "S3"
 
     astobj = cfn.stack_ast
@@ -235,58 +254,59 @@ def test_template_object():
     }
 
 
-def test_render():
-    """Test render/import_."""
-    with tempfile.TemporaryDirectory() as dirname:
-        tmpdir = pathlib.Path(dirname)
-        filename = tmpdir / "test.json"
-        with open(filename, "w", encoding="utf-8") as fobj:
-            fobj.write(json.dumps(SIMPLE_JSON))
-
-        sys.argv = ["vapor-import", filename.as_posix()]
-        import_()
+def _import(filename):
+    """Run import_ on a file and return the content of the generated file."""
+    import_(SimpleNamespace(files=[filename.as_posix()]))
+    for name in filename.parent.iterdir():
+        if name.suffix == ".py":
+            return name.read_text()
+    return ""
 
-        content = ""
-        for name in tmpdir.iterdir():
-            if name.suffix == ".py":
-                content = name.read_text()
-                break
 
-        assert content != ""
+def test_render(tmp_path):
+    """Test render/import_."""
+    filename = tmp_path / "test.json"
+    filename.write_text(SIMPLE_JSON_TEXT, encoding="utf-8")
 
+    content = _import(filename)
+    assert content != ""
     assert _lines(content) == _lines(SIMPLE_OUTPUT.format(filename=filename.name))
 
 
-def test_render_yaml():
+def test_render_yaml(tmp_path):
     """Test render/import_."""
-    with tempfile.TemporaryDirectory() as dirname:
-        tmpdir = pathlib.Path(dirname)
-        filename = tmpdir / "test.yml"
-        with open(filename, "w", encoding="utf-8") as fobj:
-            fobj.write(SIMPLE_YAML)
+    filename = tmp_path / "test.yml"
+    filename.write_text(SIMPLE_YAML, encoding="utf-8")
 
-        sys.argv = ["vapor-import", filename.as_posix()]
-        import_()
+    content = _import(filename)
+    assert content != ""
+    assert _lines(content) == _lines(SIMPLE_OUTPUT.format(filename=filename.name))
 
-        content = ""
-        for name in tmpdir.iterdir():
-            if name.suffix == ".py":
-                content = name.read_text()
-                break
 
-        assert content != ""
+def test_render_yaml_numeric_keys(tmp_path):
+    """Keys in yaml templates are loaded as strings, like they are in json."""
+    filename = tmp_path / "test.yml"
+    filename.write_text(
+        SIMPLE_YAML
+        + """
+Mappings:
+  Accounts:
+    123456789012:
+      Env: prod
+""",
+        encoding="utf-8",
+    )
 
-    assert _lines(content) == _lines(SIMPLE_OUTPUT.format(filename=filename.name))
+    content = _import(filename)
+    assert "class VaporStack(Stack):" in content
+    assert "Mappings = {'Accounts': {'123456789012': {'Env': 'prod'}}}" in content
 
 
-def test_render_invalid_suffix():
+def test_render_invalid_suffix(tmp_path):
     """Test import_ with invalid suffix"""
-    with tempfile.TemporaryDirectory() as dirname:
-        tmpdir = pathlib.Path(dirname)
-        filename = tmpdir / "test.ml"
-        filename.write_text("test")
-
-        sys.argv = ["vapor-import", filename.as_posix()]
-        with pytest.raises(ValueError) as err:
-            import_()
-        assert str(err.value).startswith("Please provide a Cloudformation template")
+    filename = tmp_path / "test.ml"
+    filename.write_text("test")
+
+    with pytest.raises(ValueError) as err:
+        _import(filename)
+    assert str(err.value).startswith("Please provide a Cloudformation template")
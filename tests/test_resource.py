@@ -4,6 +4,12 @@ Testing Resource model.
 
 We will define an S3 resource and check it's properties.
 """
+import sys
+
+import pytest
+
+import vapor
+
 # vapor generates modules on demand.
 # pylint: disable=E0611
 from vapor import S3
@@ -67,3 +73,69 @@ def test_resurce_inheritance():
         },
         "Type": "AWS::S3::Bucket",
     }
+
+
+def test_resource_class_cached():
+    """Accessing the same resource type twice should return the same class."""
+    assert S3.Bucket is S3.Bucket
+    assert Bucket.__base__ is S3.Bucket
+
+
+def test_service_module_registered():
+    """The generated module should be registered with its full name."""
+    assert sys.modules["vapor.S3"] is S3
+
+
+def test_service_module_attribute():
+    """Services can be used as attributes of the package."""
+    assert vapor.S3 is S3
+    instance = type("Instance", (vapor.EC2.Instance,), {})()
+    assert instance.resource_type == "AWS::EC2::Instance"
+    assert vapor.EC2.Instance().resource_type == "AWS::EC2::Instance"
+
+
+def test_resource_type_missing():
+    """Resources not based on a resource type have no type."""
+    resource = type("Bucket", (vapor.Resource,), {})()
+    with pytest.raises(ValueError):
+        _ = resource.resource_type
+
+
+def test_resource_property_names():
+    """Property names are cached in the class but follow changes of the class."""
+    klass = type("CachedBucket", (Bucket,), {})
+    assert klass.property_names == ("BucketName", "VersioningConfiguration")
+
+    klass.AccessControl = "Private"
+    assert klass.property_names == (
+        "AccessControl",
+        "BucketName",
+        "VersioningConfiguration",
+    )
+
+    resource = klass()
+    resource.Tags = []
+    assert list(resource.properties) == [
+        "AccessControl",
+        "BucketName",
+        "Tags",
+        "VersioningConfiguration",
+    ]
+
+
+def test_resource_property_names_mixin():
+    """Names from parents that are not models are not cached."""
+
+    class Common:  # pylint: disable=R0903
+        """A plain mixin, changes to it don't invalidate the cache."""
+
+    class MixedBucket(Common, S3.Bucket):  # pylint: disable=R0903
+        """A bucket with a plain mixin."""
+
+    assert MixedBucket.property_names == ()
+
+    # This naming convention maps to cloudformation resource properties.
+    # pylint: disable=C0103
+    Common.AccessControl = "Private"
+    assert MixedBucket.property_names == ("AccessControl",)
+    assert MixedBucket().properties == {"AccessControl": "Private"}
@@ -4,19 +4,46 @@ Testing Stack model.
 
 We will test stack attrs and cfn apis.
 """
-import os
+import asyncio
+import datetime
+import json
+import re
+from collections import OrderedDict
 from unittest.mock import MagicMock
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
 import pytest
+import yaml
 from moto import mock_cloudformation, mock_s3
+from moto.cloudformation import cloudformation_backends
 
 # vapor generates modules on demand.
 # pylint: disable=E0611
 from vapor import S3, Stack, Ref
+from vapor.stack import TemplateDumper, create_client, dump_json
+from vapor.utils import map_parallel
 
 
-os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+@pytest.fixture(name="cfn_client", scope="module")
+def fixture_cfn_client(aws_region):
+    """A cloudformation client shared by the tests in this module."""
+    with mock_cloudformation():
+        yield boto3.client(
+            "cloudformation",
+            region_name=aws_region,
+            # No need to retry or validate requests against the in-memory backend.
+            config=Config(retries={"max_attempts": 1}, parameter_validation=False),
+        )
+
+
+@pytest.fixture(name="cfn")
+def fixture_cfn(cfn_client, aws_region):
+    """Mocked cloudformation client, the backend is reset after each test."""
+    yield cfn_client
+    cloudformation_backends[aws_region].reset()
 
 
 class Bucket(S3.Bucket):
@@ -43,6 +70,10 @@ class S3Stack(Stack):
     Description = "Minimal stack with a single S3 bucket."
 
 
+# Template of the unmodified S3Stack, used to create the stack in the cfn tests.
+S3_STACK_JSON = S3Stack().json
+
+
 class BucketWithNoName(S3.Bucket):
     """test S3 resource with no bucket name"""
 
@@ -87,6 +118,12 @@ def test_stack_name():
     )()
     assert alt_stack.name == "test"
 
+    # The name follows the changes of DeployOptions, even when made in place.
+    alt_stack.DeployOptions = {"name": "renamed"}
+    assert alt_stack.name == "renamed"
+    alt_stack.DeployOptions["name"] = "renamed-again"
+    assert alt_stack.name == "renamed-again"
+
 
 def test_stack_template():
     """Test stack template."""
@@ -99,15 +136,127 @@ def test_stack_template():
     # Resources cannot be empty.
     alt_stack = type("AnotherTestStack", (Stack,), {})()
     with pytest.raises(ValueError):
-        print(alt_stack.template)
+        _ = alt_stack.template
+
+
+def test_stack_render():
+    """Test rendering the template in json and yaml format."""
+    stack = StackWithParam()
+    assert json.loads(stack.json) == stack.template
+    assert json.loads(stack.compact_json) == stack.template
+    assert len(stack.compact_json) < len(stack.json)
+    assert yaml.safe_load(stack.yaml) == stack.template
+    assert stack.template["Resources"]["BucketWithNoName"]["Properties"][
+        "BucketName"
+    ] == {"Ref": "BName"}
+
+    with pytest.raises(ValueError):
+        stack.render("toml")
+
+    # Invalid values are rejected in all the formats, they shouldn't reach the API.
+    # This naming convention maps to cloudformation template elements.
+    # pylint: disable=C0103,W0201
+    for invalid in (None, {"a", "set"}):
+        stack.Metadata = {"Key": invalid}
+        for fmt in ("json", "compact-json", "yaml"):
+            with pytest.raises(ValueError):
+                stack.render(fmt)
+
+
+def test_stack_render_container_subclass():
+    """Subclasses of dict and list are rendered like the plain containers."""
 
+    class Tags(list):
+        """A list subclass."""
+
+    bucket = type(
+        "Bucket",
+        (Bucket,),
+        {
+            "VersioningConfiguration": OrderedDict(Status="Suspended"),
+            "Tags": Tags([OrderedDict(Key="team", Value=Ref("Team"))]),
+        },
+    )
+    stack = type("ContainerStack", (Stack,), {"Resources": [bucket]})()
+    assert yaml.safe_load(stack.yaml) == stack.template
+    assert json.loads(stack.json) == stack.template
 
-@mock_cloudformation
-def test_stack_status():
+
+def test_stack_render_follows_changes():
+    """Rendered templates follow the changes of the stack and the resources."""
+    local_bucket = type("Bucket", (Bucket,), {"Tags": []})
+    stack = type(
+        "RenderStack", (Stack,), {"Resources": [local_bucket], "Parameters": {}}
+    )()
+    _ = stack.json, stack.compact_json, stack.yaml
+
+    local_bucket.BucketName = "renamed-bucket"
+    local_bucket.Tags.append({"Key": "team", "Value": "vapor"})
+    stack.Parameters["Env"] = {"Type": "String"}
+    for content in (stack.json, stack.compact_json, stack.yaml):
+        assert "renamed-bucket" in content
+        assert "team" in content
+        assert "Env" in content
+
+    stack.Resources = [Bucket, NewBucket]
+    assert "NewBucket" in stack.yaml
+    stack.Resources.pop()
+    assert "NewBucket" not in stack.yaml
+
+
+def test_stack_deploy_cache(monkeypatch):
+    """Templates are cached during the deployment, after the pre_deploy hooks."""
+    local_bucket = type("Bucket", (Bucket,), {"Tags": []})
+
+    def add_tag(stack, dryrun, wait):
+        # pylint: disable=W0613
+        local_bucket.Tags.append({"Key": "team", "Value": "vapor"})
+
+    stack = type(
+        "CachedStack",
+        (Stack,),
+        {"Resources": [local_bucket], "Hooks": {"pre_deploy": [add_tag]}},
+    )()
+    _ = stack.compact_json
+    seen = []
+
+    def fake_deploy(dryrun, wait):
+        # pylint: disable=W0613
+        seen.append(stack.compact_json)
+        assert stack.compact_json is seen[0]
+
+    monkeypatch.setattr(stack, "_Stack__deploy", fake_deploy)
+    stack.deploy()
+    assert len(seen) == 1 and "team" in seen[0]
+    # The cache is dropped after the deployment.
+    assert stack.compact_json is not seen[0]
+
+
+def test_dump_json():
+    """dump_json should render Fn/Ref nodes and reject invalid values."""
+    assert json.loads(dump_json({"Key": Ref("Value"), "List": [1, 2.5, True]})) == {
+        "Key": {"Ref": "Value"},
+        "List": [1, 2.5, True],
+    }
+    assert dump_json({"Key": [1, 2]}, indent=False) == '{"Key":[1,2]}'
+    # None, sets, bytes and dates are not valid in a template, in any format.
+    for invalid in (None, {"a", "set"}, b"bytes", datetime.date(2021, 1, 1)):
+        with pytest.raises(ValueError):
+            dump_json({"Key": invalid})
+        with pytest.raises(ValueError):
+            dump_json({"Key": [invalid]}, indent=False)
+        with pytest.raises(ValueError):
+            yaml.dump({"Key": invalid}, Dumper=TemplateDumper)
+    with pytest.raises(ValueError):
+        dump_json({"Key": Ref(None)})
+    with pytest.raises(ValueError):
+        dump_json({None: "Value"})
+
+
+def test_stack_status(cfn):
     """Test stack status that comes from boto calls."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
     assert stack.status == "CREATE_COMPLETE"
     assert stack.exists is True
 
@@ -125,47 +274,62 @@ def test_stack_status():
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_create_changeset_new_stack():
-    """Test create_change_set call with new stack."""
-    cfn = boto3.client("cloudformation")
+def test_stack_client(monkeypatch):
+    """Stacks share a client per region and profile, even when created in parallel."""
+    create_client.cache_clear()
+    stacks = [type(f"Stack{index}", (S3Stack,), {})() for index in range(16)]
+    clients = map_parallel(lambda stack: stack.client, stacks, 16)
+    assert len({id(client) for client in clients}) == 1
+    assert create_client.cache_info().currsize == 1
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-southeast-2")
+    client = S3Stack().client
+    assert client is not clients[0]
+    assert client.meta.region_name == "ap-southeast-2"
+    assert create_client.cache_info().currsize == 2
+
+
+def test_stack_create_stack(cfn, monkeypatch, tmp_path):
+    """New stacks are created directly, a dry run only validates the template."""
+    # moto writes the template to validate in file.tmp in the working directory.
+    monkeypatch.chdir(tmp_path)
     stack = S3Stack()
+    validated = []
+    validate_template = stack.client.validate_template
+    monkeypatch.setattr(
+        stack.client,
+        "validate_template",
+        lambda **kwargs: validated.append(kwargs) or validate_template(**kwargs),
+    )
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is True
-
-    # At this time, the stack is created and it's in `REVIEW_IN_PROGRESS` state
-    assert stack.exists is True
-    assert stack.status == "REVIEW_IN_PROGRESS"
+    stack._Stack__create_stack(dryrun=True, wait=False)
+    assert validated == [{"TemplateBody": stack.compact_json}]
+    assert stack.exists is False
 
-    response = cfn.describe_change_set(ChangeSetName=name, StackName=stack.name)
-    assert response["Status"] == "CREATE_COMPLETE"
-    assert len(response["Changes"]) == 1
-    change = response["Changes"][0]["ResourceChange"]
-    assert change["Action"] == "Add"
-    assert change["LogicalResourceId"] == "Bucket"
+    stack._Stack__create_stack(dryrun=False, wait=False)
+    assert stack.status == "CREATE_COMPLETE"
+    assert len(validated) == 1
+    assert cfn.list_change_sets(StackName=stack.name)["Summaries"] == []
 
     # Cleanup
-    cfn.delete_change_set(ChangeSetName=name, StackName=stack.name)
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_create_changeset_update():
+def test_stack_create_changeset_update(cfn):
     """Test create_change_set call."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
 
     # modify bucket attribute
-    stack.Resources[0].BucketName = "another-name"
+    stack.Resources = [type("Bucket", (Bucket,), {"BucketName": "another-name"})]
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is False
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
+    # Changeset names must start with a letter.
+    assert re.fullmatch(r"[a-zA-Z][-a-zA-Z0-9]*", name)
     response = cfn.describe_change_set(ChangeSetName=name, StackName=stack.name)
     assert response["Status"] == "CREATE_COMPLETE"
     assert len(response["Changes"]) == 1
@@ -178,22 +342,18 @@ def test_stack_create_changeset_update():
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_create_changeset_complex_update():
+def test_stack_create_changeset_complex_update(cfn):
     """Test create_change_set call with modification and addition."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
 
     # Change existing bucket while adding a new one
-    old_name = Bucket.BucketName
-    Bucket.BucketName = "change-of-name"
-    stack.Resources = [Bucket, NewBucket]
+    renamed = type("Bucket", (Bucket,), {"BucketName": "change-of-name"})
+    stack.Resources = [renamed, NewBucket]
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is False
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
     response = cfn.describe_change_set(ChangeSetName=name, StackName=stack.name)
     assert response["Status"] == "CREATE_COMPLETE"
     assert len(response["Changes"]) == 2
@@ -211,42 +371,64 @@ def test_stack_create_changeset_complex_update():
     assert modify_change["ResourceChange"]["LogicalResourceId"] == "Bucket"
 
     # Cleanup
-    Bucket.BucketName = old_name
     cfn.delete_change_set(ChangeSetName=name, StackName=stack.name)
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_create_empty_changeset():
-    """Test create empty changeset."""
-    cfn = boto3.client("cloudformation")
+def test_stack_create_empty_changeset(cfn):
+    """No changeset is created when the stack is running the same template."""
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
     assert stack.status == "CREATE_COMPLETE"
     assert stack.exists is True
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is False
-    response = cfn.describe_change_set(ChangeSetName=name, StackName=stack.name)
-    assert response["Status"] == "CREATE_COMPLETE"
-    assert response.get("Changes", []) == []
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
+    assert name is None
+    assert cfn.list_change_sets(StackName=stack.name)["Summaries"] == []
+
+    # A different set of parameters needs a changeset.
+    # pylint: disable=C0103,W0201
+    stack.DeployOptions = {"parameters": {"Unused": "value"}}
+    # pylint: disable=E1101,W0212
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
+    assert name is not None
+
+    # Cleanup
+    cfn.delete_change_set(ChangeSetName=name, StackName=stack.name)
+    cfn.delete_stack(StackName=stack.name)
+
+
+def test_stack_create_changeset_no_get_template(cfn, monkeypatch):
+    """A changeset is created when the deployed template can't be read."""
+    stack = S3Stack()
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
+
+    error = ClientError(
+        {"Error": {"Code": "AccessDenied", "Message": "Not allowed"}}, "GetTemplate"
+    )
+    monkeypatch.setattr(stack.client, "get_template", MagicMock(side_effect=error))
+    # testing this private method.
+    # pylint: disable=E1101,W0212
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
+    assert name is not None
 
     # Cleanup
     cfn.delete_change_set(ChangeSetName=name, StackName=stack.name)
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_wait_changeset():
+def test_stack_wait_changeset(cfn):
     """Test wait changeset call."""
     stack = S3Stack()
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
+    # Add a bucket into the stack
+    stack.Resources = [Bucket, NewBucket]
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is True
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
 
     # testing this private method.
     # pylint: disable=E1101,W0212
@@ -255,32 +437,74 @@ def test_stack_wait_changeset():
         {
             "ResourceChange": {
                 "Action": "Add",
-                "LogicalResourceId": "Bucket",
+                "LogicalResourceId": "NewBucket",
                 "ResourceType": "AWS::S3::Bucket",
             },
             "Type": "Resource",
         }
     ]
 
+    # Cleanup
+    cfn.delete_change_set(ChangeSetName=name, StackName=stack.name)
+    cfn.delete_stack(StackName=stack.name)
 
-@mock_cloudformation
-def test_stack_empty_changeset():
+
+def test_stack_wait_changeset_paginated(aws_region):
+    """Test all pages of a large changeset are fetched once it is ready."""
+    stack = S3Stack()
+    stack._client = boto3.client(  # pylint: disable=W0212
+        "cloudformation", region_name=aws_region
+    )
+    change = {
+        "Type": "Resource",
+        "ResourceChange": {"Action": "Add", "LogicalResourceId": "Bucket"},
+    }
+    kwargs = {"ChangeSetName": "changeset", "StackName": stack.name}
+
+    with Stubber(stack.client) as stubber:
+        stubber.add_response(
+            "describe_change_set",
+            {"Status": "CREATE_COMPLETE", "ExecutionStatus": "AVAILABLE"},
+            kwargs,
+        )
+        stubber.add_response(
+            "describe_change_set", {"Changes": [change], "NextToken": "token"}, kwargs
+        )
+        stubber.add_response(
+            "describe_change_set",
+            {"Changes": [change, change]},
+            {**kwargs, "NextToken": "token"},
+        )
+        # testing this private method.
+        # pylint: disable=E1101,W0212
+        changes = stack._Stack__wait_changeset("changeset")
+        stubber.assert_no_pending_responses()
+
+    assert changes == [change] * 3
+
+
+def test_stack_empty_changeset(cfn, monkeypatch):
     """Test wait changeset call with empty changeset."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
+    # Make the template different, so a changeset is created.
+    stack.Resources = [type("Bucket", (Bucket,), {"BucketName": "another-name"})]
 
     # testing this private method.
     # pylint: disable=E1101,W0212
-    create_stack, name = stack._Stack__create_changeset()
-    assert create_stack is False
+    name = stack._Stack__create_changeset(stack.describe_stack_response)
+    assert name is not None
 
     empty_changeset_response = {
         "Status": "FAILED",
         "StatusReason": "No updates are to be performed.",
         "ExecutionStatus": "UNAVAILABLE",
     }
-    stack.client.describe_change_set = MagicMock(return_value=empty_changeset_response)
+    monkeypatch.setattr(
+        stack.client,
+        "describe_change_set",
+        MagicMock(return_value=empty_changeset_response),
+    )
 
     # testing this private method.
     # pylint: disable=E1101,W0212
@@ -290,9 +514,11 @@ def test_stack_empty_changeset():
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_dunder_deploy_dryrun():
+@pytest.mark.usefixtures("cfn")
+def test_stack_dunder_deploy_dryrun(monkeypatch, tmp_path):
     """Test stack deploy with dryrun."""
+    # moto writes the template to validate in file.tmp in the working directory.
+    monkeypatch.chdir(tmp_path)
     stack = S3Stack()
 
     # Dry run should work.
@@ -302,55 +528,53 @@ def test_stack_dunder_deploy_dryrun():
     assert stack.exists is False
 
 
-@mock_cloudformation
-def test_stack_dunder_deploy_wetrun():
+def test_stack_dunder_deploy_wetrun(cfn, monkeypatch):
     """Test stack deploy with wetrun."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
 
+    calls = []
+    monkeypatch.setattr(stack, "_Stack__wait_stack", calls.append)
     # testing this private method.
-    # pylint: disable=E1101,W0201,W0212,C0103
-    stack._Stack__wait_stack = MagicMock(return_value=None)
     # pylint: disable=E1101,W0212
     stack._Stack__deploy(dryrun=False, wait=True)
     assert stack.status == "CREATE_COMPLETE"
-    stack._Stack__wait_stack.assert_called()
+    assert calls == ["stack_create_complete"]
+    # New stacks are created directly.
+    assert cfn.list_change_sets(StackName=stack.name)["Summaries"] == []
 
     # cleanup
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_dunder_deploy_empty_update():
+def test_stack_dunder_deploy_empty_update(cfn, monkeypatch):
     """Test stack deploy with empty updates."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
 
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
     assert stack.status == "CREATE_COMPLETE"
     assert stack.exists is True
 
-    stack.client.execute_change_set = MagicMock(return_value=None)
-    stack.client.delete_change_set = MagicMock(return_value=None)
+    calls = []
+    for method in ("execute_change_set", "delete_change_set"):
+        monkeypatch.setattr(
+            stack.client, method, lambda method=method, **_: calls.append(method)
+        )
     # testing this private method.
     # pylint: disable=E1101,W0212
     stack._Stack__deploy(dryrun=False, wait=False)
 
     # These two methods shouldn't have been called
     # because the changeset is empty.
-    stack.client.execute_change_set.assert_not_called()
-    stack.client.delete_change_set.assert_not_called()
+    assert not calls
 
     # cleanup
     cfn.delete_stack(StackName=stack.name)
 
 
-@mock_cloudformation
-def test_stack_dunder_deploy_update():
+def test_stack_dunder_deploy_update(cfn):
     """Test stack deploy with updates."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
 
     # Add a bucket into the stack
     stack.Resources = [Bucket, NewBucket]
@@ -366,10 +590,8 @@ def test_stack_dunder_deploy_update():
 
 
 @mock_s3
-@mock_cloudformation
-def test_stack_deploy():
+def test_stack_deploy(cfn):
     """Test stack deploy with wetrun."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
 
     stack.deploy(dryrun=False, wait=True)
@@ -385,10 +607,10 @@ def test_stack_deploy():
 
 
 @mock_s3
-@mock_cloudformation
-def test_stack_deploy_hooks():
+def test_stack_deploy_hooks(cfn, monkeypatch, tmp_path):
     """Test stack deploy hooks with dryrun and wetrun."""
-    cfn = boto3.client("cloudformation")
+    # moto writes the template to validate in file.tmp in the working directory.
+    monkeypatch.chdir(tmp_path)
     stack = S3Stack()
 
     stack.pre_deploy = MagicMock(return_value=None)
@@ -406,12 +628,10 @@ def test_stack_deploy_hooks():
 
 
 @mock_s3
-@mock_cloudformation
-def test_stack_delete():
+def test_stack_delete(cfn):
     """Test delete stack."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
 
     s3_cli = boto3.client("s3")
     buckets = s3_cli.list_buckets()["Buckets"]
@@ -428,12 +648,10 @@ def test_stack_delete():
     assert len(buckets) == 0
 
 
-@mock_cloudformation
-def test_stack_delete_hooks():
+def test_stack_delete_hooks(cfn):
     """Test stack delete hooks with dryrun and wetrun."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
 
     stack.pre_delete = MagicMock(return_value=None)
     stack.post_delete = MagicMock(return_value=None)
@@ -447,12 +665,10 @@ def test_stack_delete_hooks():
     stack.post_delete.assert_called()
 
 
-@mock_cloudformation
-def test_stack_dunder_delete():
+def test_stack_dunder_delete(cfn):
     """Test stack deletion."""
-    cfn = boto3.client("cloudformation")
     stack = S3Stack()
-    cfn.create_stack(StackName=stack.name, TemplateBody=stack.json)
+    cfn.create_stack(StackName=stack.name, TemplateBody=S3_STACK_JSON)
     assert stack.status == "CREATE_COMPLETE"
 
     # testing this private method.
@@ -461,10 +677,8 @@ def test_stack_dunder_delete():
 
 
 @mock_s3
-@mock_cloudformation
-def test_stack_deploy_with_parameter():
+def test_stack_deploy_with_parameter(cfn):
     """Test stack deploy with parameter."""
-    cfn = boto3.client("cloudformation")
     stack = StackWithParam()
 
     # sadly moto does not parse parameters when we are creating a changeset.
@@ -485,3 +699,39 @@ def test_stack_deploy_with_parameter():
 
     # cleanup
     cfn.delete_stack(StackName=stack.name)
+
+
+@mock_s3
+def test_stack_deploy_many(cfn):
+    """Test deploying several stacks at the same time."""
+    stacks = [S3Stack(), StackWithParam()]
+    assert stacks[0].client is stacks[1].client
+
+    Stack.deploy_many(stacks, dryrun=False, wait=True)
+    for stack in stacks:
+        assert stack.status == "CREATE_COMPLETE"
+
+    # cleanup
+    for stack in stacks:
+        cfn.delete_stack(StackName=stack.name)
+
+
+@mock_s3
+@pytest.mark.usefixtures("cfn")
+def test_stack_adeploy():
+    """Test deploying and deleting stacks from asyncio."""
+    stacks = [S3Stack(), StackWithParam()]
+
+    async def deploy():
+        await asyncio.gather(*(stack.adeploy(dryrun=False) for stack in stacks))
+
+    async def delete():
+        await asyncio.gather(*(stack.adelete(dryrun=False) for stack in stacks))
+
+    asyncio.run(deploy())
+    for stack in stacks:
+        assert stack.status == "CREATE_COMPLETE"
+
+    asyncio.run(delete())
+    for stack in stacks:
+        assert stack.exists is False
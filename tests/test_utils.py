@@ -4,7 +4,7 @@ Testing helpers in utils.py
 """
 import logging
 
-from vapor.utils import get_logger, ColorFormatter
+from vapor.utils import get_logger, map_parallel, ColorFormatter
 from vapor.stack import format_changes, format_name
 
 
@@ -35,6 +35,21 @@ def test_color_logger(caplog, capsys):
         assert lines[i].startswith(expected_color)
 
 
+def test_get_logger_twice():
+    """the handler should only be added once."""
+    assert get_logger("twice") is get_logger("twice")
+    assert len(logging.getLogger("twice").handlers) == 1
+
+
+def test_color_formatter_custom_level():
+    """levels without a color are logged as plain messages."""
+    record = logging.LogRecord("unit", 25, __file__, 1, "message", None, None)
+    assert ColorFormatter().format(record) == "message"
+    assert ColorFormatter("%(levelname)s: %(message)s").format(record) == (
+        "Level 25: message"
+    )
+
+
 def test_format_changes():
     """test format_changes function."""
     change1 = {
@@ -64,3 +79,10 @@ def test_format_changes():
     line2 = "[MODIFY] EC2(AWS::EC2::Instance)"
     formatted = format_changes([change1, change2])
     assert formatted == "\n".join([line1, line2])
+
+
+def test_map_parallel():
+    """results of map_parallel should keep the order of the input."""
+    assert map_parallel(lambda x: x * 2, range(20), max_workers=4) == [
+        x * 2 for x in range(20)
+    ]
@@ -2,6 +2,7 @@
 """
 finder to create dynamic modules.
 """
+import importlib
 import sys
 
 from importlib.machinery import ModuleSpec
@@ -10,6 +11,8 @@ from .models import ResourceBase, StackBase, Resource
 from .fn import Ref, Fn
 from .stack import Stack
 
+__all__ = ["Fn", "Ref", "Resource", "ResourceBase", "Stack", "StackBase"]
+
 
 class AWSFinder:
     """
@@ -26,8 +29,7 @@ class AWSFinder:
         """
         # pylint: disable=W0613
         if name.startswith("vapor."):
-            _, service = name.split(".", 1)
-            return ModuleSpec(service, cls())
+            return ModuleSpec(name[len("vapor.") :], LOADER)
         return None
 
     def create_module(self, _):
@@ -38,10 +40,31 @@ class AWSFinder:
     def exec_module(self, module):
         """Create a dynamic class and return it."""
         def _getattr(name):
+            if name.startswith("__"):
+                raise AttributeError(f"module {module.__name__!r} has no attribute {name!r}")
             cls = type(name, (Resource,), {"_module": module})
+            # Keep the class in the module namespace, so later lookups of the same
+            # resource type won't reach __getattr__ and create a new class.
+            setattr(module, name, cls)
             return cls
 
         module.__getattr__ = _getattr
+        # The module is named after the service, as the name is used in the resource
+        # type. Register it under the full name too, so the next import of
+        # vapor.<service> is served from sys.modules without reaching the finder.
+        sys.modules[f"vapor.{module.__name__}"] = module
+
+
+LOADER = AWSFinder()
+if AWSFinder not in sys.meta_path:
+    sys.meta_path.append(AWSFinder)
 
 
-sys.meta_path += [AWSFinder]
+def __getattr__(name):
+    """
+    Create the module of a service on first access, so vapor.S3 works without an
+    import statement. The module is then set on the package by the import system.
+    """
+    if not name[:1].isupper():
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return importlib.import_module(f"{__name__}.{name}")
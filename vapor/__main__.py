@@ -7,11 +7,20 @@ import argparse
 import json
 import sys
 from datetime import datetime
-from functools import cached_property
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
 
 import jinja2
-from cfn_flip import to_json
+import yaml
+from cfn_tools.yaml_loader import multi_constructor
+
+from .fn import Fn
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    # PyYAML is built without libyaml, fallback to the pure python loader.
+    from yaml import SafeLoader
 
 
 TEMPLATE = '''
@@ -29,6 +38,37 @@ from vapor import Stack, Ref, Fn, {{ template.services }}
 {{ template.stack_code }}
 '''
 
+# ast contexts are stateless, so the same instance can be shared by all nodes.
+_LOAD = ast.Load()
+_STORE = ast.Store()
+
+
+class CfnYamlLoader(SafeLoader):  # pylint: disable=R0901
+    """
+    Yaml loader for Cloudformation templates.
+
+    This is the loader of cfn-flip on top of libyaml: short form functions like
+    `!Ref` are loaded in their long form. Timestamps are kept as strings, so an
+    unquoted AWSTemplateFormatVersion is not turned into a date.
+    """
+
+    def construct_mapping(self, node, deep=False):
+        """
+        Keys are converted to strings, the way they would be in a json template, so
+        mappings keyed by account IDs can be transcribed.
+        """
+        mapping = super().construct_mapping(node, deep=deep)
+        return {
+            key if isinstance(key, str) else json.dumps(key): value
+            for key, value in mapping.items()
+        }
+
+
+CfnYamlLoader.add_multi_constructor("!", multi_constructor)
+CfnYamlLoader.add_constructor(
+    "tag:yaml.org,2002:timestamp", lambda loader, node: loader.construct_scalar(node)
+)
+
 
 class CfnTemplate:
     """Represents a Cloudformation template."""
@@ -37,12 +77,15 @@ class CfnTemplate:
         """Represents a Cloudformation template."""
         self.data = data
 
-    @property
+    @cached_property
     def resources(self):
-        """A list of Resource instances."""
+        """
+        A list of Resource instances.
+        The instances are kept, so the ast objects cached on them are reused.
+        """
         return [Resource(name, data) for name, data in self.data["Resources"].items()]
 
-    @property
+    @cached_property
     def services(self):
         """Services from the resources."""
         return ", ".join(sorted({resource.service for resource in self.resources}))
@@ -56,15 +99,11 @@ class CfnTemplate:
         assert "Resources" in self.data
 
         body = []
-        resources = ast.Assign(
-            targets=[ast.Name(id="Resources", ctx=ast.Store())],
-            value=ast.List(
-                elts=[ast.Name(id=name, ctx=ast.Load()) for name in self.data["Resources"]],
-                ctx=ast.Load(),
-            ),
-            lineno=0,
+        resources = ast.List(
+            elts=[name_node(resource.logical_name) for resource in self.resources],
+            ctx=_LOAD,
         )
-        body.append(resources)
+        body.append(assign_node("Resources", resources))
 
         optionals = [
             "AWSTemplateFormatVersion",
@@ -79,136 +118,182 @@ class CfnTemplate:
         for name in optionals:
             if name not in self.data:
                 continue
-
-            kwargs = {
-                "targets": [ast.Name(id=name, ctx=ast.Store())],
-                "value": parse_node(self.data[name]),
-                "lineno": 0,
-            }
-            node = ast.Assign(**kwargs)
-            body.append(node)
+            body.append(assign_node(name, parse_node(self.data[name])))
 
         return ast.ClassDef(
             name="VaporStack",
-            bases=[ast.Name(id="Stack", ctx=ast.Load())],
+            bases=[name_node("Stack")],
             keywords=[],
             body=body,
             decorator_list=[],
         )
 
-    @property
+    @cached_property
     def stack_code(self):
         """Python code as string constructed from ast."""
         return ast.unparse(self.stack_ast)
 
 
-def parse_fn(func, node):
-    """Parse an Fn::Something construct."""
-    if isinstance(node, list):
-        args = [parse_node(item) for item in node]
-    else:
-        args = [parse_node(node)]
-    return ast.Call(
-        func=ast.Attribute(value=ast.Name(id="Fn", ctx=ast.Load()), attr=func, ctx=ast.Load()),
-        args=args,
-        keywords=[],
-    )
+def assign_node(name, value):
+    """Build an `name = value` assignment node."""
+    # It looks like a bug in python 3.9 that if the lineno is not added
+    # to the assign node, we will bump into an AttributeError.
+    return ast.Assign(targets=[ast.Name(id=name, ctx=_STORE)], value=value, lineno=0)
 
 
-def parse_node(node):
-    """Turn a python object back to ast object."""
+# The nodes built by name_node and constant_node are shared, as templates repeat the
+# same names and values over and over. They must not be modified after creation.
+@lru_cache(maxsize=4096)
+def name_node(name, attr=None):
+    """Build a `name` or `name.attr` node for loading."""
+    node = ast.Name(id=name, ctx=_LOAD)
+    if attr is None:
+        return node
+    return ast.Attribute(value=node, attr=attr, ctx=_LOAD)
+
+
+@lru_cache(maxsize=4096, typed=True)
+def constant_node(value):
+    """Build a constant node, typed so that 1, 1.0 and True are different nodes."""
+    return ast.Constant(value=value)
+
+
+def call_node(func, args):
+    """Build a call node without keyword arguments."""
+    return ast.Call(func=func, args=args, keywords=[])
+
+
+def _build_ref(value, _pending):
+    """Build the ast object of a Ref construct."""
+    return call_node(name_node("Ref"), [constant_node(value)])
+
+
+def _build_fn(func, value, pending):
+    """Build the ast object of an Fn::Something construct."""
+    items = value if isinstance(value, list) else [value]
+    args = [None] * len(items)
+    pending.append((items, args))
+    return call_node(name_node("Fn", func), args)
+
+
+# Builders of the intrinsic functions, keyed by the key used in the template.
+BUILDERS = {"Ref": _build_ref}
+BUILDERS.update(
+    {
+        f"Fn::{func}": partial(_build_fn, func)
+        for func in vars(Fn)
+        if not func.startswith("_")
+    }
+)
+
+
+def _parse_one(node, pending):
+    """
+    Turn a single python object back to ast object.
+
+    The children of containers are left empty and queued in pending together with
+    the list they should be stored in, so parse_node can fill them without recursion.
+    """
     if isinstance(node, list):
-        return ast.List(elts=[parse_node(item) for item in node], ctx=ast.Load())
+        elts = [None] * len(node)
+        pending.append((node, elts))
+        return ast.List(elts=elts, ctx=_LOAD)
     if isinstance(node, dict):
         if len(node) == 1:
-            key = list(node)[0]
-            if key == "Ref":
-                return ast.Call(
-                    func=ast.Name(id="Ref", ctx=ast.Load()),
-                    args=[ast.Constant(value=node[key])],
-                    keywords=[],
-                )
+            key, value = next(iter(node.items()))
+            builder = BUILDERS.get(key)
+            if builder is not None:
+                return builder(value, pending)
             if key.startswith("Fn::"):
-                func = key.split("::")[1]
-                return parse_fn(func, node[key])
-        keys = []
-        values = []
-        for key, value in node.items():
-            keys.append(ast.Constant(value=key))
-            values.append(parse_node(value))
-        return ast.Dict(keys=keys, values=values)
+                # A function we don't know about yet, build it anyway.
+                return _build_fn(key.split("::")[1], value, pending)
+        values = [None] * len(node)
+        pending.append((list(node.values()), values))
+        return ast.Dict(keys=[constant_node(key) for key in node], values=values)
     if isinstance(node, (str, int, float)):
-        return ast.Constant(value=node)
+        return constant_node(node)
     raise ValueError(f"Invalid data type specified in the code: {node}")
 
 
+def parse_node(node):
+    """Turn a python object back to ast object."""
+    pending = []
+    parsed = _parse_one(node, pending)
+    while pending:
+        items, targets = pending.pop()
+        for index, item in enumerate(items):
+            targets[index] = _parse_one(item, pending)
+    return parsed
+
+
 class Resource:
     """Represents a resource in Cloudformation template."""
 
+    __slots__ = (
+        "logical_name",
+        "data",
+        "provider",
+        "service",
+        "type_name",
+        "_astobj",
+        "_code",
+    )
+
     def __init__(self, logical_name, data):
         self.logical_name = logical_name
         self.data = data
+        # Type is like AWS::S3::Bucket, the service (think of S3, EC2, SSM) is the
+        # second part. Custom::Name has no third part, so the name is the last one.
+        parts = data["Type"].split("::")
+        self.provider, self.service, self.type_name = parts[0], parts[1], parts[-1]
+        # Built on first use, see astobj and code.
+        self._astobj = None
+        self._code = None
 
-    @cached_property
+    @property
     def astobj(self):
         """
         Return the ast object of the resource instance.
         This is later used to construct the python source code.
         """
-        resource_type = self.data["Type"].split("::")[-1]
+        if self._astobj is not None:
+            return self._astobj
         body = []
-        provider = self.data["Type"].split("::")[0]
-        # It looks like a bug in python 3.9 that if the lineno is not added
-        # to the assign node, we will bump into an AttributeError.
-        if provider != "AWS":
-            body.append(
-                ast.Assign(
-                    targets=[ast.Name(id="Meta", ctx=ast.Store())],
-                    value=ast.Dict(
-                        keys=[ast.Constant(value="provider")],
-                        values=[ast.Constant(value=provider)],
-                    ),
-                    lineno=0,
-                )
+        if self.provider != "AWS":
+            meta = ast.Dict(
+                keys=[ast.Constant(value="provider")],
+                values=[ast.Constant(value=self.provider)],
             )
+            body.append(assign_node("Meta", meta))
         for key, value in self.data["Properties"].items():
-            kwargs = {
-                "targets": [ast.Name(id=key, ctx=ast.Store())],
-                "value": parse_node(value),
-                "lineno": 0,
-            }
-            node = ast.Assign(**kwargs)
-            body.append(node)
-        return ast.ClassDef(
+            body.append(assign_node(key, parse_node(value)))
+        self._astobj = ast.ClassDef(
             name=self.logical_name,
-            bases=[
-                ast.Attribute(
-                    value=ast.Name(id=self.service, ctx=ast.Load()),
-                    attr=resource_type,
-                    ctx=ast.Load(),
-                )
-            ],
+            bases=[name_node(self.service, self.type_name)],
             decorator_list=[],
             keywords=[],
             body=body,
         )
+        return self._astobj
 
     @property
     def code(self):
         """Python code as string constructed from ast."""
-        return ast.unparse(self.astobj)
+        if self._code is None:
+            self._code = ast.unparse(self.astobj)
+        return self._code
 
-    @property
-    def service(self):
-        """Service of this resource, think of S3, EC2, SSM."""
-        return self.data["Type"].split("::")[1]
+
+@lru_cache(maxsize=None)
+def jinja_template():
+    """Compile TEMPLATE once, on first use, and reuse it for all the files."""
+    return jinja2.Template(TEMPLATE.lstrip())
 
 
 def render(filename, data):
     """Render the dict into a vapor python script."""
-    template = jinja2.Template(TEMPLATE.lstrip())
     cfn = CfnTemplate(data)
-    return template.render(
+    return jinja_template().render(
         original_file_name=filename,
         template=cfn,
     )
@@ -222,15 +307,13 @@ def import_(args):
             raise RuntimeError(f"File does not exist: {pathobj.as_posix()}")
         with pathobj.open(encoding="utf-8") as fobj:
             if pathobj.suffix in [".yml", ".yaml"]:
-                content = fobj.read().strip()
-                data = to_json(content)
+                data = yaml.load(fobj, Loader=CfnYamlLoader)
             elif pathobj.suffix == ".json":
-                data = fobj.read()
+                data = json.load(fobj)
             else:
                 raise ValueError(
                     "Please provide a Cloudformation template file that ends in .json/.yml"
                 )
-            data = json.loads(data)
 
         newname = f"{pathobj.stem}-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.py"
         fileobj = pathobj.with_name(newname)
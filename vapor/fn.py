@@ -2,41 +2,114 @@
 """
 Models that maps to Cloudformation functions.
 """
+import sys
 
 
-def replace_fn(node):
-    """Iteratively replace all Fn/Ref in the node"""
-    if isinstance(node, list):
-        return [replace_fn(item) for item in node]
-    if isinstance(node, dict):
-        return {name: replace_fn(value) for name, value in node.items()}
+def _replace_node(node, pending):
+    """
+    Replace a single node.
+
+    Containers are returned empty and queued in pending together with their source,
+    so replace_fn can fill them without recursion.
+    """
+    node_type = type(node)
+    if node_type in _SCALARS:
+        return node
+    if node_type in _RENDERABLE:
+        return node.render()
+    create = _CONTAINERS.get(node_type)
+    if create is None:
+        # Subclasses of the containers, like OrderedDict.
+        for container_type, container_create in _CONTAINERS.items():
+            if isinstance(node, container_type):
+                create = container_create
+                break
+    if create is not None:
+        new_node = create(node)
+        pending.append((node, new_node))
+        return new_node
     if isinstance(node, (str, int, float)):
         return node
-    if isinstance(node, Ref):
+    if isinstance(node, BaseFn):
+        # Subclasses of Fn/Ref.
         return node.render()
-    if hasattr(Fn, node.__class__.__name__):
+    raise ValueError(f"Invalid value specified in the code: {node}")
+
+
+def render_node(node):
+    """
+    Render a single Fn/Ref node.
+
+    This is used as the fallback of the json/yaml encoders, so Fn/Ref nodes are
+    rendered while the template is being serialized.
+    """
+    if type(node) in _RENDERABLE or isinstance(node, BaseFn):
         return node.render()
     raise ValueError(f"Invalid value specified in the code: {node}")
 
 
-class Ref:
+def replace_fn(node):
+    """Iteratively replace all Fn/Ref in the node"""
+    # Bind the names used in the loop to locals, which are cheaper to look up.
+    # pylint: disable=C0103
+    _type, scalars, replace_node = type, _SCALARS, _replace_node
+    pending = []
+    pop = pending.pop
+    replaced = replace_node(node, pending)
+    while pending:
+        source, target = pop()
+        # Most of the leaves are scalars, check them inline to save a function call.
+        # The targets are built by _CONTAINERS, they are either a dict or a list.
+        if isinstance(target, dict):
+            for name, value in source.items():
+                if _type(value) in scalars:
+                    target[name] = value
+                else:
+                    target[name] = replace_node(value, pending)
+        else:
+            for index, item in enumerate(source):
+                if _type(item) in scalars:
+                    target[index] = item
+                else:
+                    target[index] = replace_node(item, pending)
+    return replaced
+
+
+class BaseFn:
+    """Base class of Ref and all the functions."""
+
+    # pylint: disable=R0903
+    __slots__ = ()
+
+    def render(self):
+        """Render the node as a dictionary."""
+        raise NotImplementedError
+
+
+class Ref(BaseFn):
     """Represents a ref function in Cloudformation."""
 
     # This is our DSL, it's a very thin wrapper around dictionary.
     # pylint: disable=R0903
+    __slots__ = ("target",)
+
     def __init__(self, target):
         """Creates a Ref node with a target."""
-        self.target = target
+        # The same logical names are referenced all over a template, share them.
+        # sys.intern refuses str subclasses, so the exact type is checked.
+        # pylint: disable=C0123
+        self.target = sys.intern(target) if type(target) is str else target
 
     def render(self):
         """Render the node as a dictionary."""
         return {"Ref": self.target}
 
 
-class Base64:
+class Base64(BaseFn):
     """Fn::Base64 function."""
 
     # pylint: disable=R0903
+    __slots__ = ("value",)
 
     def __init__(self, value):
         self.value = value
@@ -46,10 +119,11 @@ class Base64:
         return {"Fn::Base64": replace_fn(self.value)}
 
 
-class Cidr:
+class Cidr(BaseFn):
     """Fn::Cidr function."""
 
     # pylint: disable=R0903
+    __slots__ = ("ipblock", "count", "cidr_bits")
 
     def __init__(self, ipblock, count, cidr_bits):
         self.ipblock = ipblock
@@ -67,10 +141,11 @@ class Cidr:
         }
 
 
-class And:
+class And(BaseFn):
     """Fn::And function."""
 
     # pylint: disable=R0903
+    __slots__ = ("conditions",)
 
     def __init__(self, *args):
         self.conditions = list(args)
@@ -80,10 +155,11 @@ class And:
         return {"Fn::And": replace_fn(self.conditions)}
 
 
-class Equals:
+class Equals(BaseFn):
     """Fn::Equals function."""
 
     # pylint: disable=R0903
+    __slots__ = ("lhs", "rhs")
 
     def __init__(self, lhs, rhs):
         self.lhs = lhs
@@ -94,10 +170,11 @@ class Equals:
         return {"Fn::Equals": [replace_fn(self.lhs), replace_fn(self.rhs)]}
 
 
-class If:
+class If(BaseFn):
     """Fn::If function."""
 
     # pylint: disable=R0903
+    __slots__ = ("condition", "true_value", "false_value")
 
     def __init__(self, condition, true_value, false_value):
         self.condition = condition
@@ -115,10 +192,11 @@ class If:
         }
 
 
-class Not:
+class Not(BaseFn):
     """Fn::Not function."""
 
     # pylint: disable=R0903
+    __slots__ = ("condition",)
 
     def __init__(self, condition):
         self.condition = condition
@@ -128,10 +206,11 @@ class Not:
         return {"Fn::Not": [replace_fn(self.condition)]}
 
 
-class Or:
+class Or(BaseFn):
     """Fn::Or function."""
 
     # pylint: disable=R0903
+    __slots__ = ("conditions",)
 
     def __init__(self, *args):
         self.conditions = list(args)
@@ -141,10 +220,11 @@ class Or:
         return {"Fn::Or": replace_fn(self.conditions)}
 
 
-class FindInMap:
+class FindInMap(BaseFn):
     """Fn::FindInMap function."""
 
     # pylint: disable=R0903
+    __slots__ = ("map_name", "l1key", "l2key")
 
     def __init__(self, map_name, l1key, l2key):
         self.map_name = map_name
@@ -162,10 +242,11 @@ class FindInMap:
         }
 
 
-class GetAtt:
+class GetAtt(BaseFn):
     """Fn::GetAtt function."""
 
     # pylint: disable=R0903
+    __slots__ = ("logical_name", "attr")
 
     def __init__(self, logical_name, attr):
         self.logical_name = logical_name
@@ -176,10 +257,11 @@ class GetAtt:
         return {"Fn::GetAtt": [replace_fn(self.logical_name), replace_fn(self.attr)]}
 
 
-class GetAZs:
+class GetAZs(BaseFn):
     """Fn::GetAZs function."""
 
     # pylint: disable=R0903
+    __slots__ = ("region",)
 
     def __init__(self, region):
         self.region = region
@@ -189,10 +271,11 @@ class GetAZs:
         return {"Fn::GetAZs": replace_fn(self.region)}
 
 
-class ImportValue:
+class ImportValue(BaseFn):
     """Fn::ImportValue function."""
 
     # pylint: disable=R0903
+    __slots__ = ("export",)
 
     def __init__(self, export):
         self.export = export
@@ -202,10 +285,11 @@ class ImportValue:
         return {"Fn::ImportValue": replace_fn(self.export)}
 
 
-class Join:
+class Join(BaseFn):
     """Fn::Join function."""
 
     # pylint: disable=R0903
+    __slots__ = ("delimiter", "elements")
 
     def __init__(self, delimiter, elements):
         self.delimiter = delimiter
@@ -216,10 +300,11 @@ class Join:
         return {"Fn::Join": [replace_fn(self.delimiter), replace_fn(self.elements)]}
 
 
-class Select:
+class Select(BaseFn):
     """Fn::Select function."""
 
     # pylint: disable=R0903
+    __slots__ = ("index", "elements")
 
     def __init__(self, index, elements):
         self.index = index
@@ -230,10 +315,11 @@ class Select:
         return {"Fn::Select": [replace_fn(self.index), replace_fn(self.elements)]}
 
 
-class Split:
+class Split(BaseFn):
     """Fn::Split function."""
 
     # pylint: disable=R0903
+    __slots__ = ("delimiter", "target")
 
     def __init__(self, delimiter, target):
         self.delimiter = delimiter
@@ -244,10 +330,11 @@ class Split:
         return {"Fn::Split": [replace_fn(self.delimiter), replace_fn(self.target)]}
 
 
-class Sub:
+class Sub(BaseFn):
     """Fn::Sub function."""
 
     # pylint: disable=R0903
+    __slots__ = ("mapping", "target")
 
     def __init__(self, target, mapping=None):
         if not isinstance(target, str):
@@ -267,10 +354,11 @@ class Sub:
         return {"Fn::Sub": replace_fn(self.target)}
 
 
-class Transform:
+class Transform(BaseFn):
     """Fn::Transform function."""
 
     # pylint: disable=R0903
+    __slots__ = ("construct",)
 
     def __init__(self, construct):
         is_dict = isinstance(construct, dict)
@@ -317,3 +405,16 @@ class Fn:
     Split = Split
     Sub = Sub
     Transform = Transform
+
+
+_SCALARS = frozenset([str, int, float, bool])
+_RENDERABLE = frozenset(
+    [Ref]
+    + [value for name, value in vars(Fn).items() if not name.startswith("_")]
+)
+# Create the empty container which replaces a container in replace_fn.
+_CONTAINERS = {
+    dict: lambda node: {},
+    list: lambda node: [None] * len(node),
+    tuple: lambda node: [None] * len(node),
+}
@@ -2,17 +2,19 @@
 """Default hooks provided by vapor."""
 import json
 import sys
-
-from cfnlint.config import ConfigFileArgs
-from cfnlint.core import get_rules, get_exit_code, get_formatter
-from cfnlint.decode.cfn_json import CfnJSONDecoder
-from cfnlint.runner import Runner
-from jsonschema.exceptions import ValidationError
+import threading
+from functools import lru_cache
 
 from .utils import get_logger
 
+# cfn-lint takes more than a second to import, and it's only needed when we lint a
+# template, so it's imported in the functions below.
+# pylint: disable=C0415
+
 
 logger = get_logger(__name__)
+# cfn-lint rules hold the state of the template being checked, see get_cfnlint_rules.
+_local = threading.local()
 
 
 def cleanup_rollback_complete(self, dryrun, wait):
@@ -23,8 +25,17 @@ def cleanup_rollback_complete(self, dryrun, wait):
             self.delete(dryrun, wait)
 
 
+@lru_cache(maxsize=None)
 def read_cfnlint_config(default_region):
-    """Read configuration files for cfn-lint."""
+    """
+    Read configuration files for cfn-lint.
+
+    The configuration is read once per region, call read_cfnlint_config.cache_clear()
+    to read the files again.
+    """
+    from cfnlint.config import ConfigFileArgs
+    from jsonschema.exceptions import ValidationError
+
     try:
         config = ConfigFileArgs()
     except ValidationError as err:
@@ -50,14 +61,26 @@ def read_cfnlint_config(default_region):
     return config
 
 
-def check_template_with_cfn_lint(self, _dryrun, _wait):
-    """Predeploy hook to check template with cfn-lint."""
-    config = read_cfnlint_config(default_region=self.region)
-    filename = f"{self.name}.json"
+def get_cfnlint_rules(default_region):
+    """
+    Load the cfn-lint rules selected in the configuration.
+
+    Loading the rules imports and instantiates every rule module, so it's done once
+    per region. The rules keep the state of the template they are checking, so they
+    are only reused within a thread, stacks linted in parallel get their own rules.
+    """
+    from cfnlint.core import get_rules
+
+    cache = getattr(_local, "rules", None)
+    if cache is None:
+        cache = _local.rules = {}
+    if default_region in cache:
+        return cache[default_region]
 
+    config = read_cfnlint_config(default_region)
     # these attrs are set in read_cfnlint_config if not defined from config file.
     # pylint: disable=E1101
-    rules = get_rules(
+    rules = cache[default_region] = get_rules(
         config.append_rules,
         config.ignore_checks,
         config.include_checks,
@@ -66,6 +89,23 @@ def check_template_with_cfn_lint(self, _dryrun, _wait):
         config.mandatory_checks,
         config.custom_rules,
     )
+    return rules
+
+
+def check_template_with_cfn_lint(self, _dryrun, _wait):
+    """Predeploy hook to check template with cfn-lint."""
+    from cfnlint.core import get_exit_code, get_formatter
+    from cfnlint.decode.cfn_json import CfnJSONDecoder
+    from cfnlint.runner import Runner
+
+    config = read_cfnlint_config(self.region)
+    rules = get_cfnlint_rules(self.region)
+    filename = f"{self.name}.json"
+
+    # cfn-lint is used as a library here, no subprocess is involved. The template
+    # is decoded from its json text on purpose: CfnJSONDecoder attaches the line
+    # marks cfn-lint uses in its rules and error messages, a plain dict has none.
+    # pylint: disable=E1101
     matches = Runner(
         rules,
         filename,
@@ -5,47 +5,91 @@ from .utils import get_logger
 
 
 logger = get_logger(__name__)
+_super_new = type.__new__
 
 
-class ResourceBase(type):
+class ModelBase(type):
+    """
+    Common base of the metaclasses in vapor.
+
+    The generation is bumped whenever a resource or a stack class is modified after
+    creation, so the property names cached on the resource classes know they are
+    stale.
+    """
+
+    generation = 0
+
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+        ModelBase.generation += 1
+
+    def __delattr__(cls, name):
+        super().__delattr__(name)
+        ModelBase.generation += 1
+
+
+class ResourceBase(ModelBase):
     """Metaclass for all cfn resources."""
 
     def __new__(mcs, name, bases, attrs):
-        super_new = super().__new__
-
         # Only perform custom logic for the subclasses of Resource, but not Resource
         # itself.
-        parents = [b for b in bases if isinstance(b, ResourceBase)]
-        if not parents:
-            return super_new(mcs, name, bases, attrs)
+        if not any(isinstance(b, ResourceBase) for b in bases):
+            return _super_new(mcs, name, bases, attrs)
 
-        new_class = super_new(mcs, name, bases, attrs)
         if "_module" in attrs:
-            # We need to pass it down to the subclass
-            setattr(new_class, "__module__", attrs["_module"].__name__)
-
-        return new_class
+            # Resource types like S3.Bucket, created by the service modules. The type
+            # name is inherited by the subclasses defined by the user.
+            service = attrs["_module"].__name__
+            attrs["__module__"] = service
+            attrs["_type_name"] = f"{service}::{name}"
 
+        return _super_new(mcs, name, bases, attrs)
 
-class StackBase(type):
+    @property
+    def property_names(cls):
+        """
+        Sorted names of the properties defined in the resource class and its parents.
+
+        The names are cached in the class, the cache is refreshed when a model changes.
+        Changes to parents that are not models, like plain mixins, don't bump the
+        generation, so the names of classes with such parents are never cached.
+        """
+        cached = cls.__dict__.get("_property_names")
+        if cached is not None and cached[0] == ModelBase.generation:
+            return cached[1]
+        names = tuple(
+            sorted(
+                {
+                    name
+                    for klass in cls.__mro__
+                    for name in vars(klass)
+                    if name[0].isupper()
+                }
+            )
+        )
+        if all(isinstance(klass, ModelBase) for klass in cls.__mro__[:-1]):
+            # Use type.__setattr__, this is a cache and not a change of the model.
+            type.__setattr__(cls, "_property_names", (ModelBase.generation, names))
+        return names
+
+
+class StackBase(ModelBase):
     """Metaclass for all cfn stacks."""
 
     def __new__(mcs, name, bases, attrs):
-        super_new = super().__new__
-
         # Only perform custom logic for the subclasses of Stack, but not Stack itself.
-        parents = [b for b in bases if isinstance(b, StackBase)]
-        if not parents:
-            return super_new(mcs, name, bases, attrs)
-
-        new_class = super_new(mcs, name, bases, attrs)
-        return new_class
+        # There is no custom logic for now, so both paths create the class directly.
+        return _super_new(mcs, name, bases, attrs)
 
 
 class Resource(metaclass=ResourceBase):
     """Represents a resource defintion in Cloudformation."""
 
     _Meta = {"provider": "AWS"}
+    # Like S3::Bucket, set by ResourceBase on the resource types of the service
+    # modules and inherited by their subclasses.
+    _type_name = None
 
     @property
     def logical_name(self):
@@ -54,15 +98,13 @@ class Resource(metaclass=ResourceBase):
 
     @property
     def resource_type(self):
-        """Return the type of the resource by analysing the import path."""
-        base_class = type(self).__base__
-        while True:
-            parent = base_class.__base__
-            if parent.__module__ == "vapor.models" and parent.__name__ == "Resource":
-                break
-            base_class = parent
+        """Return the type of the resource, like AWS::S3::Bucket."""
+        if self._type_name is None:
+            raise ValueError(
+                f"{self.logical_name} should subclass a resource type like S3.Bucket."
+            )
         provider = self._Meta.get("provider", "AWS")
-        return f"{provider}::{base_class.__module__}::{base_class.__name__}"
+        return f"{provider}::{self._type_name}"
 
     @property
     def template(self):
@@ -73,10 +115,26 @@ class Resource(metaclass=ResourceBase):
         }
 
     @property
-    def properties(self):
-        """Return the properties of the resource."""
+    def raw_template(self):
+        """Return the template fragment of the resource, with Fn/Ref not rendered."""
         return {
-            name: replace_fn(getattr(self, name))
-            for name in dir(self)
-            if name[0].isupper()
+            "Type": self.resource_type,
+            "Properties": self.attributes,
         }
+
+    @property
+    def attributes(self):
+        """Return the properties of the resource as defined in the class."""
+        names = type(self).property_names
+        if self.__dict__:
+            # Properties set on the instance.
+            names = sorted(
+                set(names).union(name for name in self.__dict__ if name[0].isupper())
+            )
+        return {name: getattr(self, name) for name in names}
+
+    @property
+    def properties(self):
+        """Return the properties of the resource."""
+        attributes = self.attributes
+        return dict(zip(attributes, map(replace_fn, attributes.values())))
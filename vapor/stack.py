@@ -1,26 +1,133 @@
 #!/usr/bin/env python3
 """Model definitions in vapor."""
-import json
-import random
+import asyncio
+import datetime
+import os
 import re
+import secrets
+import threading
 import time
-from datetime import datetime
+from functools import lru_cache, partial
+from operator import itemgetter
 
-import boto3
 import yaml
-from botocore.exceptions import ClientError
 
+from .fn import render_node
 from .hooks import (
     cleanup_rollback_complete,
     check_template_with_cfn_lint,
 )
 from .models import StackBase
-from .utils import get_logger
+from .utils import dump_json, get_logger, map_parallel
+
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    # PyYAML is built without libyaml, fallback to the pure python dumper and loader.
+    from yaml import SafeDumper, SafeLoader
 
 
 logger = get_logger(__name__)
+# Patterns used by format_name to split camel case words.
+WORD_PATTERN = re.compile("(.)([A-Z][a-z]+)")
+CAPITAL_PATTERN = re.compile("([a-z0-9])([A-Z])")
+# Let botocore back off and retry when we are throttled, which is more likely when
+# several stacks are deployed at the same time.
+RETRIES = {"mode": "adaptive", "max_attempts": 10}
+# Statuses in which the template of the stack is the one deployed.
+STABLE_STATUSES = frozenset(
+    ["CREATE_COMPLETE", "UPDATE_COMPLETE", "UPDATE_ROLLBACK_COMPLETE", "IMPORT_COMPLETE"]
+)
+# Optional template elements, included when they are defined in the stack.
+OPTIONALS = (
+    "Conditions",
+    "Mappings",
+    "Metadata",
+    "Outputs",
+    "Parameters",
+    "Rules",
+    "Transform",
+)
+MISSING = object()
+# Poll the stack status every 5 seconds, some resources like CloudFront
+# distributions can take a long time, so we will wait for up to 3 hours.
+STACK_WAITER_CONFIG = {"Delay": 5, "MaxAttempts": 2160}
+# Changesets are usually ready within seconds, but nested stacks can take minutes.
+# We give up after 10 minutes, the wait used to be unbounded.
+CHANGESET_WAITER_CONFIG = {"Delay": 2, "MaxAttempts": 300}
+EMPTY_CHANGESET_REASONS = ("didn't contain changes", "No updates are to be performed.")
+
+# boto3 is slow to import, and it's not needed if we only render templates, so it's
+# imported when we need to talk to AWS.
+# pylint: disable=C0415
+
+
+# Serializes the creation of the clients, see get_client.
+CLIENT_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def create_client(region=None, profile=None):
+    """
+    Create the cloudformation client for a region and a profile.
 
+    boto3 clients are thread safe, so the stacks share a client and its connection
+    pool, even when they are deployed in parallel. Each client gets its own session,
+    the default one of boto3 is not thread safe.
+    """
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.session.Session(region_name=region, profile_name=profile)
+    return session.client("cloudformation", config=Config(retries=RETRIES))
+
+
+def get_client():
+    """
+    Return the cloudformation client for the region and profile in the environment.
 
+    lru_cache doesn't stop concurrent first calls from creating their own clients,
+    so they are created with the lock held.
+    """
+    key = (os.environ.get("AWS_DEFAULT_REGION"), os.environ.get("AWS_PROFILE"))
+    with CLIENT_LOCK:
+        return create_client(*key)
+
+
+class TemplateDumper(SafeDumper):
+    """
+    Yaml dumper for Cloudformation templates.
+
+    Fn/Ref nodes are rendered by the representer while dumping, so we don't need
+    to build an intermediate template first.
+    """
+
+    # pylint: disable=R0901
+
+    def ignore_aliases(self, data):
+        """
+        pyyaml will try to be smart and add an anchor to the generated yaml file.
+        This "feature" is not desirable.
+        """
+        return True
+
+
+def _represent_node(dumper, node):
+    """Represent a Fn/Ref node, render_node raises ValueError for anything else."""
+    return dumper.represent_dict(render_node(node))
+
+
+TemplateDumper.add_representer(None, _represent_node)
+# SafeDumper knows how to dump these, but they are not valid in a template.
+for _invalid_type in (type(None), set, bytes, datetime.date, datetime.datetime):
+    TemplateDumper.add_representer(_invalid_type, _represent_node)
+TemplateDumper.add_representer(tuple, TemplateDumper.represent_list)
+# Subclasses of the containers, like OrderedDict, are dumped as the plain ones.
+TemplateDumper.add_multi_representer(dict, TemplateDumper.represent_dict)
+TemplateDumper.add_multi_representer(list, TemplateDumper.represent_list)
+
+
+@lru_cache(maxsize=256)
 def format_name(name):
     """
     Generate a stack name from class name by converting camel case to dash case.
@@ -32,8 +139,8 @@ def format_name(name):
 
     example: format_name("TestStack") == "test-stack"
     """
-    name = re.sub("(.)([A-Z][a-z]+)", r"\1-\2", name)
-    return re.sub("([a-z0-9])([A-Z])", r"\1-\2", name).lower()
+    name = WORD_PATTERN.sub(r"\1-\2", name)
+    return CAPITAL_PATTERN.sub(r"\1-\2", name).lower()
 
 
 def format_changes(changes):
@@ -45,21 +152,25 @@ def format_changes(changes):
     https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/using-cfn-updating-stacks-changesets-view.html
     """
     parts = []
-    for change in changes:
-        change_ = change["ResourceChange"]
+    append = parts.append
+    for change in map(itemgetter("ResourceChange"), changes):
         line = (
-            f"[{change_['Action'].upper()}] "
-            f"{change_['LogicalResourceId']}({change_['ResourceType']})"
+            f"[{change['Action'].upper()}] "
+            f"{change['LogicalResourceId']}({change['ResourceType']})"
         )
-        if "Details" in change_ and change_["Details"]:
-            line += f":\n\t{change_['Details']}"
-        parts.append(line)
+        details = change.get("Details")
+        if details:
+            line = f"{line}:\n\t{details}"
+        append(line)
     return "\n".join(parts)
 
 
 class Stack(metaclass=StackBase):
     """Represents a Cloudformation stack."""
 
+    # The public methods are the steps of the deployment and their async versions.
+    # pylint: disable=R0904
+
     Hooks = {
         "pre_deploy": [
             cleanup_rollback_complete,
@@ -68,12 +179,28 @@ class Stack(metaclass=StackBase):
     }
 
     def __init__(self):
-        self.client = boto3.client("cloudformation")
+        self._client = None
+        # Templates cached while the stack is deployed, see _cached.
+        self._cache = None
+
+    @property
+    def client(self):
+        """Cloudformation client, created on first use."""
+        if self._client is None:
+            self._client = get_client()
+        return self._client
 
     @property
     def name(self):
         """Name of the stack."""
-        return self.deploy_options.get("name", format_name(self.__class__.__name__))
+        return self._cached("name", self._build_name)
+
+    def _build_name(self):
+        """Build the name of the stack from DeployOptions or the class name."""
+        name = self.deploy_options.get("name")
+        if name is None:
+            name = format_name(self.__class__.__name__)
+        return name
 
     @property
     def region(self):
@@ -87,48 +214,85 @@ class Stack(metaclass=StackBase):
 
     @property
     def template(self):
-        """Internal python representation of a Cloudformation template."""
+        """
+        Internal python representation of a Cloudformation template.
+        """
+        return self._cached("template", lambda: self._build_template("template"))
+
+    def _build_template(self, fragment):
+        """
+        Build the template dict, using the given attribute of the resources as the
+        resource definition.
+        """
         if not hasattr(self, "Resources"):
             raise ValueError("Please define Resources in your stack.")
         # Resources is defined in child classes.
         # pylint: disable=E1101
         tmplt = {
             "AWSTemplateFormatVersion": "2010-09-09",
-            "Resources": {kls().logical_name: kls().template for kls in self.Resources},
+            "Resources": {
+                resource.logical_name: getattr(resource, fragment)
+                for resource in (kls() for kls in self.Resources)
+            },
         }
-        optionals = [
-            "Conditions",
-            "Mappings",
-            "Metadata",
-            "Outputs",
-            "Parameters",
-            "Rules",
-            "Transform",
-        ]
-        for name in optionals:
-            if hasattr(self, name):
-                tmplt[name] = getattr(self, name)
+        for name in OPTIONALS:
+            value = getattr(self, name, MISSING)
+            if value is not MISSING:
+                tmplt[name] = value
 
         return tmplt
 
+    def render(self, fmt):
+        """
+        Render the Cloudformation template in json, compact-json or yaml format.
+
+        Fn/Ref nodes are rendered by the encoder, so the template is only walked
+        once.
+        """
+        if fmt == "json":
+            dump = dump_json
+        elif fmt == "compact-json":
+            dump = partial(dump_json, indent=False)
+        elif fmt == "yaml":
+            dump = partial(yaml.dump, Dumper=TemplateDumper)
+        else:
+            raise ValueError(f"Unsupported template format: {fmt}")
+        return self._cached(fmt, lambda: dump(self._build_template("raw_template")))
+
+    def _cached(self, name, build):
+        """
+        Return the value cached under name, build it if it's not there.
+
+        Values are only cached while the stack is deployed. Otherwise they are built
+        on every call, so changes made in place, like updating a key in a dict, are
+        always picked up.
+        """
+        if self._cache is None:
+            return build()
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
     @property
     def json(self):
         """Return Cloudformaiton template in json format"""
-        return json.dumps(self.template, indent=2)
+        return self.render("json")
+
+    @property
+    def compact_json(self):
+        """Return Cloudformation template in compact json format"""
+        return self.render("compact-json")
 
     @property
     def yaml(self):
         """Return Cloudformaiton template in yaml format"""
-        # Disable anchor in yaml
-
-        # pyyaml will try to be smart and add an anchor to the generated yaml file.
-        # This "feature" is not desirable.
-        yaml.Dumper.ignore_aliases = lambda self, data: True
-        return yaml.dump(self.template, Dumper=yaml.Dumper)
+        return self.render("yaml")
 
     @property
     def describe_stack_response(self):
         """Return the response from descibe-stacks call."""
+        from botocore.exceptions import ClientError
+
         try:
             return self.client.describe_stacks(StackName=self.name)["Stacks"][0]
         except ClientError as error:
@@ -148,17 +312,54 @@ class Stack(metaclass=StackBase):
         """Check whether this stack exists."""
         return self.status != "DOES_NOT_EXIST"
 
+    @classmethod
+    def deploy_many(cls, stacks, dryrun=True, wait=True, max_workers=8):
+        """
+        Deploy independent stacks concurrently.
+
+        Most of the time in a deployment is spent on waiting for Cloudformation, so
+        the stacks are deployed in a thread pool. Please note that the stacks should
+        not depend on each other.
+        """
+        map_parallel(lambda stack: stack.deploy(dryrun, wait), stacks, max_workers)
+
+    async def adeploy(self, dryrun=True, wait=True):
+        """
+        Deploy the stack without blocking the event loop.
+
+        The deployment runs in a worker thread, so several stacks can be deployed
+        with asyncio.gather.
+        """
+        await asyncio.to_thread(self.deploy, dryrun, wait)
+
+    async def adelete(self, dryrun=True, wait=True):
+        """Delete the stack without blocking the event loop, see adeploy."""
+        await asyncio.to_thread(self.delete, dryrun, wait)
+
     def deploy(self, dryrun=True, wait=True):
         """Wrapper around different steps in the stack deployment process."""
         self.pre_deploy(dryrun, wait)
-        self.__deploy(dryrun, wait)
+        # The pre_deploy hooks may still change the stack, the name and the templates
+        # are cached from here till the deployment is done.
+        self._cache = {}
+        try:
+            self.__deploy(dryrun, wait)
+        finally:
+            self._cache = None
         self.post_deploy(dryrun, wait)
 
     def __deploy(self, dryrun, wait):
-        """Deploy stack changes via changeset."""
-        create, name = self.__create_changeset()
-        action = "Creating" if create else "Updating"
-        logger.info(f"{action} {self.name} stack.")
+        """Deploy stack changes via changeset, or create the stack if it's new."""
+        response = self.describe_stack_response
+        if response["StackStatus"] == "DOES_NOT_EXIST":
+            self.__create_stack(dryrun, wait)
+            return
+
+        name = self.__create_changeset(response)
+        if name is None:
+            logger.info(f"No change in {self.name} stack.")
+            return
+        logger.info(f"Updating {self.name} stack.")
 
         changes = self.__wait_changeset(name)
         if changes == []:
@@ -170,13 +371,10 @@ class Stack(metaclass=StackBase):
         if not dryrun:
             logger.info(f"Executing changeset `{name}`.")
             self.client.execute_change_set(ChangeSetName=name, StackName=self.name)
-            if wait and not dryrun:
-                self.__wait_stack()
+            if wait:
+                self.__wait_stack("stack_update_complete")
         else:
             self.client.delete_change_set(ChangeSetName=name, StackName=self.name)
-            if create:
-                # An empty stack will stay there until we delete it.
-                self.client.delete_stack(StackName=self.name)
             logger.info("Skipping deployment as this is a dry run.")
 
     def pre_deploy(self, dryrun, wait):
@@ -213,93 +411,134 @@ class Stack(metaclass=StackBase):
             logger.info(f"Deleting stack: `{self.name}`.")
             self.client.delete_stack(StackName=self.name)
             if wait and not dryrun:
-                self.__wait_stack()
-
-    def __create_changeset(self):
-        """Create a changeset."""
-        suffix = bytearray(random.getrandbits(8) for _ in range(4)).hex()
-        name = f"{datetime.now().strftime('%F-%H-%M-%S')}-{suffix}"
-        parameters = [
-            {"ParameterKey": key, "ParameterValue": value}
-            for key, value in self.deploy_options.get("parameters", {}).items()
-        ]
-        tags = [
-            {"Key": tag, "Value": value}
-            for tag, value in self.deploy_options.get("tags", {}).items()
-        ]
-        kwargs = {
+                self.__wait_stack("stack_delete_complete")
+
+    def __is_deployed(self, response, parameters, tags):
+        """
+        Check whether the stack in the describe-stacks response is already running our
+        template, with the same parameters and tags.
+        """
+        if response["StackStatus"] not in STABLE_STATUSES:
+            return False
+        if sorted(response.get("Parameters", []), key=str) != sorted(
+            parameters, key=str
+        ):
+            return False
+        if sorted(response.get("Tags", []), key=str) != sorted(tags, key=str):
+            return False
+
+        from botocore.exceptions import ClientError
+
+        try:
+            body = self.client.get_template(
+                StackName=self.name, TemplateStage="Original"
+            )["TemplateBody"]
+        except ClientError as error:
+            # Like a missing cloudformation:GetTemplate permission, let the changeset
+            # tell whether there are changes.
+            logger.warning(f"Failed to get the template of {self.name}: {error}")
+            return False
+        if isinstance(body, str):
+            # boto3 decodes json templates, yaml ones are returned as is.
+            try:
+                body = yaml.load(body, Loader=SafeLoader)
+            except yaml.YAMLError:
+                # Short form functions like !Ref, the template is not ours.
+                return False
+        return body == self.template
+
+    def __stack_arguments(self):
+        """Arguments shared by the create-stack and create-change-set calls."""
+        return {
             "StackName": self.name,
-            "Parameters": parameters,
-            "Tags": tags,
-            "ChangeSetName": name,
-            "ChangeSetType": "UPDATE" if self.exists else "CREATE",
+            "Parameters": [
+                {"ParameterKey": key, "ParameterValue": value}
+                for key, value in self.deploy_options.get("parameters", {}).items()
+            ],
+            "Tags": [
+                {"Key": tag, "Value": value}
+                for tag, value in self.deploy_options.get("tags", {}).items()
+            ],
             "Capabilities": self.deploy_options.get("capabilities", []),
-            "TemplateBody": self.yaml,
+            "TemplateBody": self.compact_json,
         }
 
+    def __create_stack(self, dryrun, wait):
+        """Create a new stack directly, a changeset would only list the additions."""
+        changes = [
+            {
+                "ResourceChange": {
+                    "Action": "Add",
+                    "LogicalResourceId": name,
+                    "ResourceType": resource["Type"],
+                }
+            }
+            for name, resource in self.template["Resources"].items()
+        ]
+        logger.info(f"Creating {self.name} stack: \n{format_changes(changes)}")
+        kwargs = self.__stack_arguments()
+        if dryrun:
+            self.client.validate_template(TemplateBody=kwargs["TemplateBody"])
+            logger.info("Skipping deployment as this is a dry run.")
+            return
+
+        self.client.create_stack(**kwargs)
+        if wait:
+            self.__wait_stack("stack_create_complete")
+
+    def __create_changeset(self, response):
+        """
+        Create a changeset to update the stack described in the response.
+
+        If the stack is already running the same template with the same parameters and
+        tags, no changeset is created and the name returned is None.
+        """
+        kwargs = self.__stack_arguments()
+        if self.__is_deployed(response, kwargs["Parameters"], kwargs["Tags"]):
+            return None
+
+        # Changeset names must start with a letter, the random suffix keeps names
+        # created in the same second apart.
+        name = f"vapor-{int(time.time())}-{secrets.token_hex(4)}"
+        kwargs["ChangeSetName"] = name
+        kwargs["ChangeSetType"] = "UPDATE"
+
         logger.info(f"Creating changeset {name}.")
         self.client.create_change_set(**kwargs)
-        return kwargs["ChangeSetType"] == "CREATE", name
+        return name
 
     def __wait_changeset(self, name):
         """Wait till a changeset is available and return it's changes."""
-        kwargs = {"ChangeSetName": name, "StackName": self.name}
+        from botocore.exceptions import WaiterError
 
-        while True:
-            response = self.client.describe_change_set(**kwargs)
-            status = response["Status"]
-            exec_status = response["ExecutionStatus"]
-
-            if status == "FAILED":
-                empty_changeset_reasons = [
-                    "didn't contain changes",
-                    "No updates are to be performed.",
-                ]
-                for reason in empty_changeset_reasons:
-                    if reason in response["StatusReason"]:
-                        return []
-                raise RuntimeError(
-                    f"Failed to create changeset for {self.name}: {response['StatusReason']}"
-                )
-
-            if status == "CREATE_COMPLETE" and exec_status == "AVAILABLE":
-                if not response.get("NextToken"):
-                    # Don't have lot's of changes, no need for another api call.
-                    return response.get("Changes", [])
-                changes = response.get("Changes", [])
-                # setting NextToken in kwargs.
-                kwargs["NextToken"] = response["NextToken"]
-                break
-            logger.info(
-                f"Status of changeset is `{status}`, execution status is `{exec_status}`"
+        kwargs = {"ChangeSetName": name, "StackName": self.name}
+        try:
+            self.client.get_waiter("change_set_create_complete").wait(
+                **kwargs, WaiterConfig=CHANGESET_WAITER_CONFIG
             )
-            # Change set should be ready within seconds.
-            time.sleep(3)
-
-        while True:
-            response = self.client.describe_change_set(**kwargs)
-            changes += response.get("Changes", [])
-            if not response.get("NextToken"):
-                break
-            kwargs["NextToken"] = response["NextToken"]
-        return changes
-
-    def __wait_stack(self):
-        while True:
-            current_status = self.status
-            if current_status == "DOES_NOT_EXIST":
-                # Delete complete
-                return
-
-            if current_status.split("_")[-1] in ["FAILED", "COMPLETE"]:
-                break
-            logger.info(f"Waiting till stack operation completes: {current_status}.")
-            time.sleep(5)
-
-        logger.info(f"Stack operation finished: {current_status}")
-        bad_statuses = [
-            "UPDATE_ROLLBACK_COMPLETE",
-            "ROLLBACK_COMPLETE",
-        ]
-        if current_status in bad_statuses or current_status.endswith("FAILED"):
-            raise RuntimeError("Failed to create/update stack.")
+        except WaiterError as error:
+            reason = error.last_response.get("StatusReason", "")
+            if any(empty in reason for empty in EMPTY_CHANGESET_REASONS):
+                return []
+            raise RuntimeError(
+                f"Failed to create changeset for {self.name}: {reason or error}"
+            ) from error
+
+        # The waiter doesn't return the response, so the first page is fetched again.
+        pages = self.client.get_paginator("describe_change_set").paginate(**kwargs)
+        return [change for page in pages for change in page.get("Changes", [])]
+
+    def __wait_stack(self, waiter_name):
+        """Wait till the stack operation finishes, using the waiter provided by boto3."""
+        from botocore.exceptions import WaiterError
+
+        logger.info(f"Waiting till the operation on {self.name} stack completes.")
+        try:
+            self.client.get_waiter(waiter_name).wait(
+                StackName=self.name, WaiterConfig=STACK_WAITER_CONFIG
+            )
+        except WaiterError as error:
+            raise RuntimeError(
+                f"Failed to create/update/delete stack: {error.last_response}"
+            ) from error
+        logger.info(f"Operation on {self.name} stack finished.")
@@ -2,8 +2,12 @@
 """
 Utility functions used in vapor.
 """
+import json
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from .fn import render_node
 
 
 class ColorFormatter(logging.Formatter):
@@ -24,20 +28,89 @@ class ColorFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + log_format + reset,
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # One formatter per level, built once instead of for every record.
+        self.formatters = {
+            level: logging.Formatter(log_fmt, datefmt="%Y-%m-%d %H:%M:%S")
+            for level, log_fmt in self.FORMATS.items()
+        }
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt="%Y-%m-%d %H:%M:%S")
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            # Custom levels are logged as plain messages.
+            return super().format(record)
         return formatter.format(record)
 
 
+FORMATTER = ColorFormatter()
+
+
 def get_logger(name):
     """create a colorful logger instance."""
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
+    if logger.handlers:
+        # The logger is already set up, don't log the messages twice.
+        return logger
 
     handler = logging.StreamHandler(stream=sys.stdout)
     handler.setLevel(logging.DEBUG)
 
-    handler.setFormatter(ColorFormatter())
+    handler.setFormatter(FORMATTER)
     logger.addHandler(handler)
     return logger
+
+
+def map_parallel(func, items, max_workers=8):
+    """
+    Call func with each of the items in a thread pool and return the results in order.
+
+    This is meant for IO bound work like AWS API calls, where the GIL is released
+    while we are waiting for the response.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def _reject_none(data):
+    """
+    Raise ValueError if there is a None in data.
+
+    The json encoder writes None as null without asking the default function, so
+    it has to be checked before dumping.
+    """
+    pending = [data]
+    pop = pending.pop
+    while pending:
+        node = pop()
+        if node is None:
+            raise ValueError("Invalid value specified in the code: None")
+        if isinstance(node, dict):
+            if None in node:
+                raise ValueError("Invalid value specified in the code: None")
+            pending.extend(node.values())
+        elif isinstance(node, (list, tuple)):
+            pending.extend(node)
+
+
+def _render_node(node):
+    """Render a Fn/Ref node for the json encoder, the rendered value is checked too."""
+    rendered = render_node(node)
+    _reject_none(rendered)
+    return rendered
+
+
+def dump_json(data, indent=True):
+    """
+    Dump data as json, rendering Fn/Ref nodes on the way.
+
+    The output is indented for humans by default, with indent=False it is compact,
+    which is what we send to the API. Values that are not valid in a template,
+    like None or sets, raise ValueError.
+    """
+    _reject_none(data)
+    if indent:
+        return json.dumps(data, indent=2, default=_render_node)
+    return json.dumps(data, separators=(",", ":"), default=_render_node)